@@ -9,5 +9,6 @@ def parse() -> Namespace:
     parser.add_argument("--debug", action="store_true", help="use only root logger")
     parser.add_argument("-f", "--filmarks", action="store_true", help="parse Filmarks reviews and upload to Notion")
     parser.add_argument("-a", "--all", action="store_true", help="parse all reviews (default: only on first page)")
+    parser.add_argument("-r", "--refresh", action="store_true", help="re-parse movie info instead of using the cache")
 
     return parser.parse_args()
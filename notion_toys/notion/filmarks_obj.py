@@ -1,27 +1,37 @@
+import json
+import os
+import pickle
 import re
 from dataclasses import dataclass, field
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+from logging import Logger  # type hint
+from typing import ClassVar
 from urllib.parse import urlencode, urljoin
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
-from .utils import FILMARKS_ID, FILMARKS_URL
+from .utils import FILMARKS_ID, FILMARKS_URL, SERIALIZED_MOVIE_INFO_PATH, filmarks_id_of
 
 
 @dataclass
 class WebPage:
     url: str
     parser: str = "html.parser"
+    html: str = field(init=False, repr=False)
     soup: BeautifulSoup = field(init=False)
 
     def __post_init__(self) -> None:
         self.scrape()
 
-    def scrape(self) -> None:
+    def fetch(self) -> None:
         r = requests.get(self.url)  # TODO: Timeout Error等が起きる可能性あり
         r.raise_for_status()
-        self.soup = BeautifulSoup(r.text, self.parser)
+        self.html = r.text
+
+    def scrape(self) -> None:
+        self.fetch()
+        self.soup = BeautifulSoup(self.html, self.parser)
 
 
 @dataclass
@@ -53,6 +63,89 @@ class FilmarksMyPage(WebPage):
             self.card_linked_urls.append(urljoin(self.url, div.a["href"]))
 
 
+@dataclass
+class FilmarksMovieInfoCache:
+    """FilmarksIDごとの映画情報(タイトル, ポスター, 制作年, 制作国, ジャンル, 監督, 脚本, 出演者)のキャッシュ
+
+    映画情報はほぼ変わらないので、`ttl_weeks`週間経つか`refresh`が指定されるまで使い回す
+    映画情報の抽出方法を変えたら`VERSION`を上げて、古い形式のキャッシュを使わないようにする
+    """
+
+    VERSION: ClassVar[int] = 1
+
+    ttl_weeks: int = 26
+    refresh: bool = False
+    children: dict = field(default_factory=dict)  # {FilmarksID: (VERSION, 取得日時, 映画情報)}
+    updated: bool = False
+
+    def load(self, logger: Logger | None = None) -> None:
+        if not SERIALIZED_MOVIE_INFO_PATH.exists():
+            return
+
+        try:
+            with open(SERIALIZED_MOVIE_INFO_PATH, "rb") as f:
+                self.children = pickle.load(f)
+        except Exception as e:
+            # キャッシュは高速化のためだけなので、読めなければ空から始める
+            self.children = {}
+            if logger is not None:
+                logger.warning(f"映画情報のキャッシュの読込失敗 - 空のキャッシュで続行します - {e}")
+
+    def get(self, filmarks_id: str) -> dict | None:
+        if self.refresh or filmarks_id not in self.children:
+            return None
+
+        entry = self.children[filmarks_id]
+        if entry[0] != self.VERSION:
+            return None
+
+        _, cached_at, info = entry
+        if cached_at < datetime.now() - timedelta(weeks=self.ttl_weeks):
+            return None
+
+        return info
+
+    def set(self, filmarks_id: str, info: dict) -> None:
+        self.children[filmarks_id] = (self.VERSION, datetime.now(), info)
+        self.updated = True
+
+    def serialize(self) -> None:
+        # 書込中に中断されても壊れたファイルが残らないよう、一時ファイルに書いてから置き換える
+        tmp_path = f"{SERIALIZED_MOVIE_INFO_PATH}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.children, f)
+        os.replace(tmp_path, SERIALIZED_MOVIE_INFO_PATH)
+
+
+@dataclass
+class LdJsonVerifier:
+    """JSON-LDから取り出した映画情報を使ってよいか、DOMを辿った結果と突き合わせて判断する
+
+    1回の実行ごとに作り、`verify_pages`ページ一致してから使う. 一度でも食い違ったらそれ以降は使わない
+    """
+
+    verify_pages: int = 3
+    agreed: int = 0
+    disabled: bool = False
+
+    @property
+    def trusted(self) -> bool:
+        return not self.disabled and self.agreed >= self.verify_pages
+
+    @property
+    def verifying(self) -> bool:
+        return not self.disabled and not self.trusted
+
+    def verify(self, ld_json_info: dict | None, dom_info: dict) -> None:
+        if not self.verifying or ld_json_info is None:
+            return
+
+        if ld_json_info == dom_info:
+            self.agreed += 1
+        else:
+            self.disabled = True
+
+
 @dataclass
 class FilmarksMoviePage(WebPage):
     title: str = ""
@@ -67,6 +160,29 @@ class FilmarksMoviePage(WebPage):
     writers: tuple[str] = field(default_factory=tuple)
     casts: tuple[str] = field(default_factory=tuple)
     parsed: bool = False
+    cache: FilmarksMovieInfoCache | None = field(default=None, repr=False)
+    ld_json_verifier: LdJsonVerifier | None = field(default=None, repr=False)  # Noneなら JSON-LD は使わない
+    movie_info: dict | None = field(default=None, init=False, repr=False)
+    movie_info_cached: bool = field(default=False, init=False, repr=False)
+
+    @property
+    def filmarks_id(self) -> str:
+        return filmarks_id_of(self.url)
+
+    def scrape(self) -> None:
+        self.fetch()
+
+        if self.cache is not None:
+            self.movie_info = self.cache.get(self.filmarks_id)
+            self.movie_info_cached = self.movie_info is not None
+        if self.movie_info is None and self.ld_json_verifier is not None and self.ld_json_verifier.trusted:
+            self.movie_info = _movie_info_from_ld_json(self.html)
+
+        if self.movie_info is None:
+            self.soup = BeautifulSoup(self.html, self.parser)
+        else:
+            # 映画情報は取得済みなので、レビュー部分だけパースする
+            self.soup = BeautifulSoup(self.html, self.parser, parse_only=_REVIEW_STRAINER)
 
     def parse(self) -> dict:
         if not self.soup:
@@ -94,44 +210,18 @@ class FilmarksMoviePage(WebPage):
         }
 
     def _parse_movie_info(self) -> None:
-        detail = self.soup.find("div", class_="p-content-detail__body")
-        detail_other_info = detail.find("div", class_="p-content-detail__other-info")
-        detail_people_list_others = tuple(
-            detail.find("div", class_="p-content-detail__people-list-others__wrapper").children
-        )
+        # キャッシュかJSON-LDから取得済みでなければDOMを辿る
+        info = self.movie_info
+        if info is None:
+            info = _movie_info_from_dom(self.soup)
+            if self.ld_json_verifier is not None and self.ld_json_verifier.verifying:
+                self.ld_json_verifier.verify(_movie_info_from_ld_json(self.html), info)
 
-        # タイトル
-        self.title = detail.find("h2", class_="p-content-detail__title").find("span").text
-        # ポスターURL
-        self.img_url = detail.find("img")["src"]
-        # 制作年
-        self.release_year = int(detail.find("h2", class_="p-content-detail__title").find("a").text[:-1])
-        # 制作国
-        self.countries = tuple([country.text for country in detail_other_info.find_all("a")])
-        # ジャンル
-        try:
-            self.genres = tuple(
-                [genre.text for genre in detail.find("div", class_="p-content-detail__genre").find_all("a")]
-            )
-        except AttributeError:
-            # https://filmarks.com/movies/24302 のようにジャンル情報がない映画もある
-            pass
-        # 監督
-        self.directors = tuple([person.text for person in detail_people_list_others[0].find_all("a")])
-        # 脚本
-        try:
-            self.writers = tuple([person.text for person in detail_people_list_others[1].find_all("a")])
-        except IndexError:
-            # https://filmarks.com/movies/80435 のように脚本情報がない映画もある
-            pass
-        # 出演者
-        try:
-            self.casts = tuple(
-                [cast.text for cast in detail.find("div", id="js-content-detail-people-cast").find_all("a")]
-            )
-        except AttributeError:
-            # https://filmarks.com/movies/86613 のように出演者情報がない映画もある
-            pass
+        if self.cache is not None and not self.movie_info_cached:
+            self.cache.set(self.filmarks_id, info)
+
+        for key, value in info.items():
+            setattr(self, key, value)
 
     def _parse_review(self) -> None:
         card_review = self.soup.find("div", class_="p-mark")
@@ -149,3 +239,104 @@ class FilmarksMoviePage(WebPage):
         for br in review_div.select("br"):
             br.replace_with("\n")
         self.review = review_div.text
+
+
+_REVIEW_STRAINER = SoupStrainer("div", class_="p-mark")
+_LD_JSON_PATTERN = re.compile(r"<script[^>]*type=[\"']?application/ld\+json[^>]*>(.*?)</script>", re.DOTALL)
+
+
+def _ld_names(value) -> tuple[str]:
+    """JSON-LDの Person / Country などの値(文字列・オブジェクト・それらのリスト)から名前を取り出す"""
+    if value is None:
+        return tuple()
+    if not isinstance(value, list):
+        value = [value]
+    return tuple([v["name"] if isinstance(v, dict) else v for v in value])
+
+
+def _movie_info_from_ld_json(html: str) -> dict | None:
+    """映画ページに埋め込まれたJSON-LDから映画情報を取り出す
+
+    Args:
+        html (str): 映画ページのHTML
+
+    Returns:
+        dict | None: `_movie_info_from_dom`と同じ形式. JSON-LDがない・情報が足りない場合はNone
+    """
+    for match in _LD_JSON_PATTERN.finditer(html):
+        try:
+            data = json.loads(match.group(1))
+        except json.JSONDecodeError:
+            continue
+
+        # JSONとして正しくても、オブジェクト・配列以外はJSON-LDとして扱わない
+        if isinstance(data, dict):
+            data = data.get("@graph", [data])
+        if not isinstance(data, list):
+            continue
+        for obj in data:
+            if not isinstance(obj, dict) or obj.get("@type") != "Movie":
+                continue
+
+            try:
+                image = obj["image"]
+                return {
+                    "title": obj["name"],
+                    "img_url": image["url"] if isinstance(image, dict) else image,
+                    "release_year": int(str(obj["dateCreated"])[:4]),
+                    "countries": _ld_names(obj["countryOfOrigin"]),
+                    "directors": _ld_names(obj["director"]),
+                    # ジャンル・脚本・出演者はDOMと同様にない映画もある
+                    "genres": _ld_names(obj.get("genre")),
+                    "writers": _ld_names(obj.get("author")),
+                    "casts": _ld_names(obj.get("actor")),
+                }
+            except (KeyError, TypeError, ValueError):
+                return None
+
+    return None
+
+
+def _movie_info_from_dom(soup: BeautifulSoup) -> dict:
+    """映画ページのDOMを辿って映画情報を取り出す"""
+    detail = soup.find("div", class_="p-content-detail__body")
+    detail_other_info = detail.find("div", class_="p-content-detail__other-info")
+    detail_people_list_others = tuple(
+        detail.find("div", class_="p-content-detail__people-list-others__wrapper").children
+    )
+    info = {}
+
+    # タイトル
+    info["title"] = detail.find("h2", class_="p-content-detail__title").find("span").text
+    # ポスターURL
+    info["img_url"] = detail.find("img")["src"]
+    # 制作年
+    info["release_year"] = int(detail.find("h2", class_="p-content-detail__title").find("a").text[:-1])
+    # 制作国
+    info["countries"] = tuple([country.text for country in detail_other_info.find_all("a")])
+    # ジャンル
+    try:
+        info["genres"] = tuple(
+            [genre.text for genre in detail.find("div", class_="p-content-detail__genre").find_all("a")]
+        )
+    except AttributeError:
+        # https://filmarks.com/movies/24302 のようにジャンル情報がない映画もある
+        info["genres"] = tuple()
+    # 監督
+    info["directors"] = tuple([person.text for person in detail_people_list_others[0].find_all("a")])
+    # 脚本
+    try:
+        info["writers"] = tuple([person.text for person in detail_people_list_others[1].find_all("a")])
+    except IndexError:
+        # https://filmarks.com/movies/80435 のように脚本情報がない映画もある
+        info["writers"] = tuple()
+    # 出演者
+    try:
+        info["casts"] = tuple(
+            [cast.text for cast in detail.find("div", id="js-content-detail-people-cast").find_all("a")]
+        )
+    except AttributeError:
+        # https://filmarks.com/movies/86613 のように出演者情報がない映画もある
+        info["casts"] = tuple()
+
+    return info
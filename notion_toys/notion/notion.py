@@ -1,12 +1,12 @@
 from logging import Logger  # type hint
 from urllib.parse import urljoin
 
-from .filmarks_obj import FilmarksMoviePage, FilmarksMyPage
+from .filmarks_obj import FilmarksMovieInfoCache, FilmarksMoviePage, FilmarksMyPage, LdJsonVerifier
 from .notion_obj import NotionDB, NotionMoviePage
 from .utils import DB_FILMARKS_KEY, NOTION_URL
 
 
-def run(logger: Logger, parse_all: bool = False):
+def run(logger: Logger, parse_all: bool = False, refresh: bool = False):
     # Notionデータベースの情報を取ってくる
     db = NotionDB(id=DB_FILMARKS_KEY)
     try:
@@ -25,6 +25,11 @@ def run(logger: Logger, parse_all: bool = False):
     if parse_all:
         f_mypage.parse_num_pages()
 
+    # 映画情報のキャッシュ
+    movie_info_cache = FilmarksMovieInfoCache(refresh=refresh)
+    movie_info_cache.load(logger)
+    ld_json_verifier = LdJsonVerifier()
+
     # レビューをNotionに
     for num in range(1, f_mypage.num_pages + 1):
         f_mypage.go_to({"page": num})
@@ -32,7 +37,7 @@ def run(logger: Logger, parse_all: bool = False):
 
     for url in f_mypage.card_linked_urls:
         try:
-            fpage = FilmarksMoviePage(url=url)
+            fpage = FilmarksMoviePage(url=url, cache=movie_info_cache, ld_json_verifier=ld_json_verifier)
         except Exception as e:
             logger.error(f"Filmarksの映画ページ({url})読取失敗 - {e}")
             continue
@@ -60,6 +65,8 @@ def run(logger: Logger, parse_all: bool = False):
 
         logger.debug(f"変更なし -「{npage.title.text}」")
 
-    # Notionのページをキャッシュしておく
+    # Notionのページと映画情報をキャッシュしておく
     if db.updated:
         db.serialize()
+    if movie_info_cache.updated:
+        movie_info_cache.serialize()
@@ -1,10 +1,13 @@
 import json
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from datetime import date
+from datetime import date, datetime, timedelta, timezone
 from decimal import ROUND_HALF_UP, Decimal
-from functools import cache
-from urllib.parse import urljoin, urlparse
+from functools import cache, partial
+from operator import attrgetter
+from typing import Callable, ClassVar, Iterator
+from urllib.parse import urljoin
 
 import requests
 from deepdiff import DeepDiff
@@ -15,10 +18,16 @@ from .utils import (
     DB_PROGRESS_KEY,
     FILMARKS_URL,
     HEADERS,
+    NOTION_API_REQUESTS_PER_SECOND,
     SERIALIZED_NOTION_PAGES_PATH,
+    RateLimiter,
+    filmarks_id_of,
     use_serialized_data,
 )
 
+_NOTION_API_RATE_LIMITER = RateLimiter(NOTION_API_REQUESTS_PER_SECOND)
+_LOAD_MAX_WORKERS = 4
+
 
 @cache
 def _db_process_id(year: int) -> str:
@@ -55,6 +64,18 @@ def _db_process_id(year: int) -> str:
     return r.json()["id"].replace("-", "")
 
 
+@cache
+def _movie_icon_url(score: float) -> str:
+    """スコアに応じた色の映画アイコンのURLを返す"""
+    try:
+        star_num = Decimal(str(score)).quantize(Decimal("0"), rounding=ROUND_HALF_UP)  # 正確に四捨五入
+        color = {0: "lightgray", 1: "lightgray", 2: "brown", 3: "yellow", 4: "orange", 5: "red"}[star_num]
+    except KeyError:
+        color = "gray"
+
+    return f"https://www.notion.so/icons/movie_{color}.svg"
+
+
 @dataclass(frozen=True)
 class Prop:
     name: str
@@ -62,6 +83,11 @@ class Prop:
     def to_payload(self):
         raise NotImplementedError
 
+    @classmethod
+    def from_payload(cls, name: str, value: dict):
+        """NotionAPIのプロパティ値(`properties[name]`)からPropを復元する"""
+        raise NotImplementedError
+
 
 @dataclass(frozen=True)
 class PropNumber(Prop):
@@ -70,6 +96,10 @@ class PropNumber(Prop):
     def to_payload(self) -> dict:
         return {self.name: {"number": self.num}}
 
+    @classmethod
+    def from_payload(cls, name: str, value: dict):
+        return cls(name=name, num=value["number"])
+
 
 @dataclass(frozen=True)
 class PropRichText(Prop):
@@ -78,6 +108,10 @@ class PropRichText(Prop):
     def to_payload(self) -> dict:
         return {self.name: {"rich_text": [{"text": {"content": self.text}}]}}
 
+    @classmethod
+    def from_payload(cls, name: str, value: dict):
+        return cls(name=name, text="".join([text["plain_text"] for text in value["rich_text"]]))
+
 
 @dataclass(frozen=True)
 class PropTitle(PropRichText):
@@ -86,6 +120,10 @@ class PropTitle(PropRichText):
     def to_payload(self) -> dict:
         return {self.name: {self.key: [{"text": {"content": self.text}}]}}
 
+    @classmethod
+    def from_payload(cls, name: str, value: dict):
+        return cls(name=name, text="".join([text["plain_text"] for text in value[cls.key]]))
+
 
 @dataclass(frozen=True)
 class PropUrl(Prop):
@@ -94,6 +132,10 @@ class PropUrl(Prop):
     def to_payload(self) -> dict:
         return {self.name: {"url": self.url}}
 
+    @classmethod
+    def from_payload(cls, name: str, value: dict):
+        return cls(name=name, url=value["url"])
+
     def to_external_payload(self) -> dict:
         return {"external": {"url": self.url}}
 
@@ -101,7 +143,7 @@ class PropUrl(Prop):
         if FILMARKS_URL not in self.url:
             raise ValueError("FilmarksのURLに対して呼んでください")
 
-        return urlparse(self.url).path.split("/")[-1]
+        return filmarks_id_of(self.url)
 
 
 @dataclass(frozen=True)
@@ -111,6 +153,10 @@ class PropFiles(Prop):
     def to_payload(self):
         return {self.name: {"files": [{"name": "movie_poster", "external": {"url": url}} for url in self.file_urls]}}
 
+    @classmethod
+    def from_payload(cls, name: str, value: dict):
+        return cls(name=name, file_urls=tuple([file[file["type"]]["url"] for file in value["files"]]))
+
 
 @dataclass(frozen=True)
 class PropDate(Prop):
@@ -121,6 +167,12 @@ class PropDate(Prop):
             return {}
         return {self.name: {"date": {"start": self.date.isoformat()}}}
 
+    @classmethod
+    def from_payload(cls, name: str, value: dict):
+        if not value["date"]:
+            return cls(name=name, date=None)
+        return cls(name=name, date=date.fromisoformat(value["date"]["start"]))
+
     def to_filter(self, condition: str) -> dict:
         if condition in (
             "equals",
@@ -165,6 +217,10 @@ class PropMultiselect(Prop):
             items = items[:100]
         return {self.name: {"multi_select": [{"name": name} for name in items]}}
 
+    @classmethod
+    def from_payload(cls, name: str, value: dict):
+        return cls(name=name, items=tuple([item["name"] for item in value["multi_select"]]))
+
 
 @dataclass(frozen=True)
 class PropRelation(Prop):
@@ -178,114 +234,109 @@ class PropRelation(Prop):
             }
         }
 
+    @classmethod
+    def from_payload(cls, name: str, value: dict):
+        if not value["relation"]:
+            return cls(name=name, related_db_id="")
+        return cls(name=name, related_db_id=value["relation"][0]["id"].replace("-", ""))
+
 
 @dataclass(frozen=True)
-class NotionMoviePage:
-    title: PropTitle
-    score: PropNumber
-    review: PropRichText
-    movie_url: PropUrl
-    img_files: PropFiles
-    watch_date: PropDate
-    release_year: PropNumber
-    countries: PropMultiselect = field(hash=False)
-    genres: PropMultiselect = field(hash=False)
-    directors: PropMultiselect = field(hash=False)
-    writers: PropMultiselect = field(hash=False)
-    casts: PropMultiselect = field(hash=False)
-    icon_url: PropUrl
-    relation: PropRelation
-    db_id: str
-    id: str = field(hash=False, compare=False)
+class SchemaField:
+    """記録ページの属性とPropの型・Notionのプロパティ名の対応"""
 
-    @classmethod
-    def init(
-        cls,
-        title: str,
-        score: float,
-        review: str,
-        movie_url: str,
-        img_url: str,
-        watch_date: date,
-        release_year: int,
-        countries: tuple[str],
-        genres: tuple[str],
-        directors: tuple[str],
-        writers: tuple[str],
-        casts: tuple[str],
-        related_db_id: str = "",
-        db_id: str = DB_FILMARKS_KEY,
-        id: str = "",
-    ):
-        try:
-            star_num = Decimal(str(score)).quantize(Decimal("0"), rounding=ROUND_HALF_UP)  # 正確に四捨五入
-            color = {0: "lightgray", 1: "lightgray", 2: "brown", 3: "yellow", 4: "orange", 5: "red"}[star_num]
-        except KeyError:
-            color = "gray"
+    attr: str
+    prop_type: type[Prop]
+    name: str
 
-        if not related_db_id:
-            related_db_id = _db_process_id(watch_date.year)
+    def build(self, value) -> Prop:
+        # Propはいずれも (name, 値) の順に定義している
+        return self.prop_type(self.name, value)
+
+
+@dataclass(frozen=True)
+class RecordSchema:
+    """Notionの記録ページのスキーマ
+
+    プロパティ名のハードコードはここだけにして、エンコード・デコードはスキーマから生成する
+    """
+
+    fields: tuple[SchemaField]
+    icon: str = ""  # アイコンURL(PropUrl)を持つ属性名. プロパティではないので`fields`とは別に持つ
+    partition: str = ""  # DBを分割して読み込むときに使う日付(PropDate)の属性名
+
+    def field_of(self, attr: str) -> SchemaField:
+        for f in self.fields:
+            if f.attr == attr:
+                return f
+        raise KeyError(attr)
+
+    def build(self, **values) -> dict:
+        """属性名と生の値から {属性名: Prop} を作る"""
+        return {f.attr: f.build(values[f.attr]) for f in self.fields}
+
+    def compile_decoder(self) -> Callable[[dict], dict]:
+        """NotionAPIの`properties`を1パスで {属性名: Prop} にする関数を生成する"""
+        decoders = tuple([(f.attr, f.name, partial(f.prop_type.from_payload, f.name)) for f in self.fields])
+
+        def decode(properties: dict) -> dict:
+            return {attr: decoder(properties[name]) for attr, name, decoder in decoders}
+
+        return decode
+
+    def compile_encoder(self) -> Callable[[object], dict]:
+        """記録ページをNotionAPIの`properties`にする関数を生成する"""
+        getters = tuple([attrgetter(f.attr) for f in self.fields])
+
+        def encode(page: object) -> dict:
+            properties = {}
+            for getter in getters:
+                properties |= getter(page).to_payload()
+            return properties
+
+        return encode
+
+
+class NotionRecordPage:
+    """Notionの記録ページの基底クラス
 
-        prop = {}
-        prop["title"] = PropTitle(name="タイトル", text=title)
-        prop["score"] = PropNumber(name="スコア", num=score)
-        prop["review"] = PropRichText(name="感想", text=review)
-        prop["movie_url"] = PropUrl(name="filmarks", url=movie_url)
-        prop["img_files"] = PropFiles(name="ポスター", file_urls=tuple([img_url]))
-        prop["watch_date"] = PropDate(name="鑑賞日", date=watch_date)
-        prop["release_year"] = PropNumber(name="上映年", num=release_year)
-        prop["countries"] = PropMultiselect(name="制作国", items=countries)
-        prop["genres"] = PropMultiselect(name="ジャンル", items=genres)
-        prop["directors"] = PropMultiselect(name="監督", items=directors)
-        prop["writers"] = PropMultiselect(name="脚本", items=writers)
-        prop["casts"] = PropMultiselect(name="出演者", items=casts)
-        prop["icon_url"] = PropUrl(name="アイコン", url=f"https://www.notion.so/icons/movie_{color}.svg")
-        prop["relation"] = PropRelation(name="集計", related_db_id=related_db_id)
-        prop["db_id"] = db_id
-        prop["id"] = id
-
-        return cls(**prop)
+    継承先は`SCHEMA`と`db_id`, `id`を持つ frozen な dataclass にする
+    """
+
+    SCHEMA: ClassVar[RecordSchema]
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        # 中間の抽象クラスのようにスキーマを定義しないクラスはコンパイルしない
+        if "SCHEMA" not in cls.__dict__:
+            return
+        cls._decode = staticmethod(cls.SCHEMA.compile_decoder())
+        cls._encode = staticmethod(cls.SCHEMA.compile_encoder())
 
     @classmethod
-    def from_paylaod(cls, id: str, db_id: str, prop: dict):
-        return cls.init(
-            title=prop["タイトル"]["title"][0]["text"]["content"],
-            score=prop["スコア"]["number"],
-            review=prop["感想"]["rich_text"][0]["text"]["content"],
-            movie_url=prop["filmarks"]["url"],
-            img_url=prop["ポスター"]["files"][0]["external"]["url"],
-            watch_date=date.fromisoformat(prop["鑑賞日"]["date"]["start"]),
-            release_year=prop["上映年"]["number"],
-            countries=tuple([item["name"] for item in prop["制作国"]["multi_select"]]),
-            genres=tuple([item["name"] for item in prop["ジャンル"]["multi_select"]]),
-            directors=tuple([item["name"] for item in prop["監督"]["multi_select"]]),
-            writers=tuple([item["name"] for item in prop["脚本"]["multi_select"]]),
-            casts=tuple([item["name"] for item in prop["出演者"]["multi_select"]]),
-            related_db_id=prop["集計"]["relation"][0]["id"].replace("-", ""),
-            db_id=db_id.replace("-", ""),
-            id=id.replace("-", ""),
-        )
+    def _derive(cls, prop: dict) -> dict:
+        """デコードしたPropから、プロパティとして保存されていない属性を求める"""
+        return {}
+
+    @classmethod
+    def from_payload(cls, id: str, db_id: str, prop: dict):
+        prop = cls._decode(prop)
+        prop |= cls._derive(prop)
+        return cls(**prop, db_id=db_id.replace("-", ""), id=id.replace("-", ""))
+
+    @property
+    def key(self) -> str:
+        """DB内でページを一意に識別するキー"""
+        raise NotImplementedError
 
     def _to_payload(self) -> dict:
-        return {
+        payload = {
             "parent": {"database_id": self.db_id},
-            "icon": self.icon_url.to_external_payload(),
-            "properties": {
-                **self.title.to_payload(),
-                **self.score.to_payload(),
-                **self.review.to_payload(),
-                **self.watch_date.to_payload(),
-                **self.release_year.to_payload(),
-                **self.countries.to_payload(),
-                **self.genres.to_payload(),
-                **self.directors.to_payload(),
-                **self.writers.to_payload(),
-                **self.casts.to_payload(),
-                **self.movie_url.to_payload(),
-                **self.img_files.to_payload(),
-                **self.relation.to_payload(),
-            },
+            "properties": self._encode(self),
         }
+        if self.SCHEMA.icon:
+            payload["icon"] = getattr(self, self.SCHEMA.icon).to_external_payload()
+        return payload
 
     def create(self) -> dict:
         url = urljoin(API_URL, "pages")
@@ -294,7 +345,7 @@ class NotionMoviePage:
         return r.json()
 
     def _diff(self, target: object) -> dict:
-        if not isinstance(target, NotionMoviePage):
+        if not isinstance(target, type(self)):
             raise ValueError
 
         ddiff = DeepDiff(self, target, exclude_paths="root.id", view="tree")
@@ -312,7 +363,7 @@ class NotionMoviePage:
                 attr = changed.t2
                 attr_name = changed.path()
 
-                if attr_name == "root.icon_url":
+                if attr_name == f"root.{self.SCHEMA.icon}":
                     new_prop["icon"] = attr.to_external_payload()
                     continue
 
@@ -325,7 +376,7 @@ class NotionMoviePage:
 
     def update(self, new_page: object) -> dict:
         if not self.id:
-            raise ValueError("Notionの映画ページのIDを指定してください")
+            raise ValueError("Notionの記録ページのIDを指定してください")
 
         url = urljoin(API_URL, f"pages/{self.id}")
         r = requests.patch(url, headers=HEADERS, data=json.dumps(self._diff(new_page)))
@@ -333,30 +384,136 @@ class NotionMoviePage:
         return r.json()
 
 
+@dataclass(frozen=True)
+class NotionMoviePage(NotionRecordPage):
+    SCHEMA: ClassVar[RecordSchema] = RecordSchema(
+        fields=(
+            SchemaField("title", PropTitle, "タイトル"),
+            SchemaField("score", PropNumber, "スコア"),
+            SchemaField("review", PropRichText, "感想"),
+            SchemaField("movie_url", PropUrl, "filmarks"),
+            SchemaField("img_files", PropFiles, "ポスター"),
+            SchemaField("watch_date", PropDate, "鑑賞日"),
+            SchemaField("release_year", PropNumber, "上映年"),
+            SchemaField("countries", PropMultiselect, "制作国"),
+            SchemaField("genres", PropMultiselect, "ジャンル"),
+            SchemaField("directors", PropMultiselect, "監督"),
+            SchemaField("writers", PropMultiselect, "脚本"),
+            SchemaField("casts", PropMultiselect, "出演者"),
+            SchemaField("relation", PropRelation, "集計"),
+        ),
+        icon="icon_url",
+        partition="watch_date",
+    )
+
+    title: PropTitle
+    score: PropNumber
+    review: PropRichText
+    movie_url: PropUrl
+    img_files: PropFiles
+    watch_date: PropDate
+    release_year: PropNumber
+    countries: PropMultiselect = field(hash=False)
+    genres: PropMultiselect = field(hash=False)
+    directors: PropMultiselect = field(hash=False)
+    writers: PropMultiselect = field(hash=False)
+    casts: PropMultiselect = field(hash=False)
+    icon_url: PropUrl
+    relation: PropRelation
+    db_id: str
+    id: str = field(hash=False, compare=False)
+
+    @classmethod
+    def init(
+        cls,
+        title: str,
+        score: float,
+        review: str,
+        movie_url: str,
+        img_url: str,
+        watch_date: date,
+        release_year: int,
+        countries: tuple[str],
+        genres: tuple[str],
+        directors: tuple[str],
+        writers: tuple[str],
+        casts: tuple[str],
+        related_db_id: str = "",
+        db_id: str = DB_FILMARKS_KEY,
+        id: str = "",
+    ):
+        if not related_db_id:
+            related_db_id = _db_process_id(watch_date.year)
+
+        prop = cls.SCHEMA.build(
+            title=title,
+            score=score,
+            review=review,
+            movie_url=movie_url,
+            img_files=tuple([img_url]),
+            watch_date=watch_date,
+            release_year=release_year,
+            countries=countries,
+            genres=genres,
+            directors=directors,
+            writers=writers,
+            casts=casts,
+            relation=related_db_id,
+        )
+        prop |= cls._derive(prop)
+
+        return cls(**prop, db_id=db_id, id=id)
+
+    @classmethod
+    def _derive(cls, prop: dict) -> dict:
+        return {"icon_url": PropUrl(name="アイコン", url=_movie_icon_url(prop["score"].num))}
+
+    @property
+    def key(self) -> str:
+        return self.movie_url.to_filmarks_id()
+
+
 @dataclass
 class NotionDB:
     id: str
+    page_cls: type[NotionRecordPage] = NotionMoviePage
     children: dict = field(default_factory=dict)
     updated: bool = False
 
-    def load_pages(self) -> None:
+    def load_pages(self, partitioned: bool = True) -> None:
         if use_serialized_data():
             with open(SERIALIZED_NOTION_PAGES_PATH, "rb") as f:
                 self.children = pickle.load(f)
             return
 
-        payload = {"page_size": 10}
+        if partitioned and self.page_cls.SCHEMA.partition:
+            results = self._query_partitioned()
+        else:
+            results = list(self._query())
+
+        for obj in results:
+            self.add(obj)
+
+        self.serialize()
+
+    def _query(self, filter: dict | None = None, sorts: list | None = None, page_size: int = 10) -> Iterator[dict]:
+        """DBのクエリ結果を`next_cursor`を辿りながら返す"""
+        payload = {"page_size": page_size}
         # 100だとリクエストが重すぎて 503 Error になる
+        if filter:
+            payload["filter"] = filter
+        if sorts:
+            payload["sorts"] = sorts
 
         while True:
+            _NOTION_API_RATE_LIMITER.wait()
             r = requests.post(
                 urljoin(API_URL, f"databases/{self.id}/query"), headers=HEADERS, data=json.dumps(payload)
             )
             r.raise_for_status()
 
             data = r.json()
-            for obj in data["results"]:
-                self.add(obj)
+            yield from data["results"]
 
             if data["has_more"]:
                 payload["start_cursor"] = data["next_cursor"]
@@ -364,35 +521,101 @@ class NotionDB:
 
             break
 
-        self.serialize()
+    def _partition_filters(self) -> list[dict]:
+        """DBを重複なく覆う、日付プロパティの年ごとのフィルターを作る"""
+        name = self.page_cls.SCHEMA.field_of(self.page_cls.SCHEMA.partition).name
+
+        def to_filter(condition: str, day: date | None = None) -> dict:
+            return PropDate(name=name, date=day).to_filter(condition)["filter"]
+
+        filters = [to_filter("is_empty")]
+
+        # 最も古い日付の年から分割する
+        oldest = next(
+            self._query(
+                filter=to_filter("is_not_empty"),
+                sorts=[{"property": name, "direction": "ascending"}],
+                page_size=1,
+            ),
+            None,
+        )
+        if oldest is None:
+            return filters
+
+        first_year = date.fromisoformat(oldest["properties"][name]["date"]["start"][:10]).year
+        last_year = max(first_year, date.today().year)
+        if first_year == last_year:
+            return filters + [to_filter("is_not_empty")]
+
+        # 最初と最後の年は範囲外の日付も含める
+        filters.append(to_filter("before", date(first_year + 1, 1, 1)))
+        for year in range(first_year + 1, last_year):
+            filters.append(
+                {"and": [to_filter("on_or_after", date(year, 1, 1)), to_filter("before", date(year + 1, 1, 1))]}
+            )
+        filters.append(to_filter("on_or_after", date(last_year, 1, 1)))
+
+        return filters
+
+    def _query_partitioned(self) -> list[dict]:
+        """DBを年ごとに分割し、それぞれを並列にクエリする
+
+        読込中に日付が更新されたページは、読込済みの分割に移って取りこぼされうるので、
+        最後に読込中に更新されたページを取り直して上書きする
+        """
+        # last_edited_time は分単位に丸められるので余裕をもたせる
+        started_at = datetime.now(timezone.utc).replace(second=0, microsecond=0) - timedelta(minutes=1)
+
+        with ThreadPoolExecutor(max_workers=_LOAD_MAX_WORKERS) as executor:
+            partitions = list(executor.map(lambda f: list(self._query(filter=f)), self._partition_filters()))
+
+        results = {}
+        duplicated = set()
+        for obj in (obj for partition in partitions for obj in partition):
+            if obj["id"] in results:
+                duplicated.add(obj["id"])
+            results[obj["id"]] = obj
+
+        edited = {
+            obj["id"]: obj
+            for obj in self._query(
+                filter={"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": started_at.isoformat()}}
+            )
+        }
+
+        # 読込中に更新されていないページが重複するなら分割が重なっているので、分割せずに読み込み直す
+        if duplicated - edited.keys():
+            return list(self._query())
+
+        return list((results | edited).values())
 
-    def add(self, obj: object) -> NotionMoviePage:
+    def add(self, obj: object) -> NotionRecordPage:
         if isinstance(obj, dict):
-            obj = NotionMoviePage.from_paylaod(
+            obj = self.page_cls.from_payload(
                 id=obj["id"],
                 db_id=obj["parent"]["database_id"],
                 prop=obj["properties"],
             )
 
-        if not isinstance(obj, NotionMoviePage):
+        if not isinstance(obj, self.page_cls):
             raise ValueError
 
-        self.children[obj.movie_url.to_filmarks_id()] = obj
+        self.children[obj.key] = obj
         self.updated = True
         return obj
 
     def has(self, page: object) -> bool:
-        if not isinstance(page, NotionMoviePage):
+        if not isinstance(page, self.page_cls):
             raise ValueError
 
-        return page.movie_url.to_filmarks_id() in self.children
+        return page.key in self.children
 
-    def get_page(self, page: object) -> NotionMoviePage | None:
-        if not isinstance(page, NotionMoviePage):
+    def get_page(self, page: object) -> NotionRecordPage | None:
+        if not isinstance(page, self.page_cls):
             raise ValueError
 
         try:
-            return self.children[page.movie_url.to_filmarks_id()]
+            return self.children[page.key]
         except KeyError:
             return None
 
@@ -1,5 +1,8 @@
+import time
 from datetime import datetime, timedelta
 from importlib import resources
+from threading import Lock
+from urllib.parse import urlparse
 
 import yaml
 
@@ -19,12 +22,23 @@ HEADERS = {
 }
 
 NOTION_URL = conf["notion"]["url"]
+NOTION_API_REQUESTS_PER_SECOND = 3  # NotionAPIのレート制限(平均3リクエスト/秒)
 
 FILMARKS_URL = conf["filmarks"]["url"]
 FILMARKS_ID = conf["filmarks"]["id"]
 
 _SERIALIZED_NOTION_PAGES_FILENAME = "notion_pages.pkl"
 SERIALIZED_NOTION_PAGES_PATH = resources.files("notion_toys.data") / _SERIALIZED_NOTION_PAGES_FILENAME
+_SERIALIZED_MOVIE_INFO_FILENAME = "filmarks_movie_info.pkl"
+SERIALIZED_MOVIE_INFO_PATH = resources.files("notion_toys.data") / _SERIALIZED_MOVIE_INFO_FILENAME
+
+
+def filmarks_id_of(url: str) -> str:
+    """Filmarksの映画ページのURLからFilmarksIDを取り出す
+
+    Notionの映画DBのキーと映画情報キャッシュのキーを揃えるため、必ずこれを使う
+    """
+    return urlparse(url).path.split("/")[-1]
 
 
 def use_serialized_data(last_modified_limit_weeks: int = 1) -> bool:
@@ -45,3 +59,21 @@ def use_serialized_data(last_modified_limit_weeks: int = 1) -> bool:
     _last_modified_limit = datetime.now() - timedelta(weeks=last_modified_limit_weeks)
 
     return _last_modified_dt > _last_modified_limit
+
+
+class RateLimiter:
+    """複数スレッドで共有して、リクエストの間隔を`1 / requests_per_second`秒以上空ける"""
+
+    def __init__(self, requests_per_second: float) -> None:
+        self._interval = 1 / requests_per_second
+        self._next = 0.0
+        self._lock = Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait_sec = self._next - now
+            self._next = max(now, self._next) + self._interval
+
+        if wait_sec > 0:
+            time.sleep(wait_sec)
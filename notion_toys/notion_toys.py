@@ -9,4 +9,4 @@ def main():
 
     if args.filmarks:
         logger.info("FilmarksとNotionを同期します")
-        notion.run(logger, parse_all=args.all)
+        notion.run(logger, parse_all=args.all, refresh=args.refresh)
@@ -0,0 +1,57 @@
+import atexit
+import importlib.util
+import shutil
+import sys
+import tempfile
+from importlib import resources
+from pathlib import Path
+
+import notion_toys
+
+# notion_toys.notion.utils はインポート時に docs/notion_config.yaml と notion_toys.data を読むので、
+# ローカルの設定がない環境(CIなど)ではテスト用のダミーに差し替える
+
+_STUB_NOTION_CONFIG = """\
+notion:
+    url: https://www.notion.so/
+    api:
+        url: https://api.notion.com/v1/
+        version: '2022-06-28'
+        integration:
+            token:
+                movie: DUMMY_TOKEN
+    database:
+        id:
+            movie_progress: DUMMYPROGRESSDB
+            movie_filmarks: DUMMYFILMARKSDB
+
+filmarks:
+    url: https://filmarks.com
+    id: dummy_user
+"""
+
+_STUB_DIR = Path(tempfile.mkdtemp(prefix="notion_toys_tests_"))
+atexit.register(shutil.rmtree, _STUB_DIR, ignore_errors=True)
+
+
+def _load_stub_package(name: str, path: Path) -> None:
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "__init__.py").touch()
+    spec = importlib.util.spec_from_file_location(name, path / "__init__.py", submodule_search_locations=[str(path)])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules[name] = module
+
+
+if not resources.files("docs").joinpath("notion_config.yaml").is_file():
+    _docs = _STUB_DIR / "docs"
+    _docs.mkdir()
+    (_docs / "notion_config.yaml").write_text(_STUB_NOTION_CONFIG, encoding="utf-8")
+    for _file in resources.files("docs").iterdir():
+        if _file.is_file():
+            shutil.copy(_file, _docs / _file.name)
+    _load_stub_package("docs", _docs)
+
+if importlib.util.find_spec("notion_toys.data") is None:
+    _load_stub_package("notion_toys.data", _STUB_DIR / "data")
+    notion_toys.data = sys.modules["notion_toys.data"]
@@ -0,0 +1,180 @@
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from bs4 import BeautifulSoup
+
+from notion_toys.notion import filmarks_obj
+from notion_toys.notion.filmarks_obj import (
+    FilmarksMovieInfoCache,
+    FilmarksMoviePage,
+    LdJsonVerifier,
+    _movie_info_from_dom,
+    _movie_info_from_ld_json,
+)
+
+FIXTURES = Path(__file__).parent / "fixtures"
+MOVIE_URL = "https://filmarks.com/movies/84000"
+
+
+def _read_fixture(filename: str) -> str:
+    return (FIXTURES / filename).read_text(encoding="utf-8")
+
+
+def _mock_get(html: str):
+    response = mock.Mock(text=html)
+    return mock.patch.object(filmarks_obj.requests, "get", return_value=response)
+
+
+@pytest.mark.parametrize(
+    "filename",
+    [
+        "filmarks_movie.html",
+        "filmarks_movie_no_genre.html",
+        "filmarks_movie_no_writer.html",
+        "filmarks_movie_no_cast.html",
+    ],
+)
+def test_movie_info_ld_json_equals_dom(filename):
+    html = _read_fixture(filename)
+
+    info = _movie_info_from_ld_json(html)
+
+    assert info is not None
+    assert info == _movie_info_from_dom(BeautifulSoup(html, "html.parser"))
+
+
+def test_movie_info_without_ld_json():
+    html = _read_fixture("filmarks_movie.html").replace('type="application/ld+json"', 'type="text/plain"')
+
+    assert _movie_info_from_ld_json(html) is None
+    assert _movie_info_from_dom(BeautifulSoup(html, "html.parser"))["title"] == "M&M 〜テスト映画〜"
+
+
+@pytest.mark.parametrize("ld_json", ["5", "null", '"Movie"', '{"@graph": 5}', '{"@graph": null}'])
+def test_movie_info_ld_json_not_container(ld_json):
+    html = _read_fixture("filmarks_movie.html")
+    html = re.sub(r'(<script type="application/ld\+json">).*?(</script>)', rf"\g<1>{ld_json}\g<2>", html)
+
+    assert _movie_info_from_ld_json(html) is None
+
+
+def test_ld_json_used_after_verification():
+    html = _read_fixture("filmarks_movie.html")
+    verifier = LdJsonVerifier()
+
+    with _mock_get(html):
+        expected = FilmarksMoviePage(url=MOVIE_URL, ld_json_verifier=verifier).parse()
+        for _ in range(verifier.verify_pages - 1):
+            FilmarksMoviePage(url=MOVIE_URL, ld_json_verifier=verifier).parse()
+
+        page = FilmarksMoviePage(url=MOVIE_URL, ld_json_verifier=verifier)
+
+    # 映画情報はJSON-LDから取り、レビュー部分だけパースしている
+    assert page.soup.find("div", class_="p-content-detail__body") is None
+    assert page.parse() == expected
+
+
+def test_ld_json_disabled_on_mismatch():
+    html = _read_fixture("filmarks_movie.html").replace('"name":"監督A"', '"name":"監督B"')
+
+    verifier = LdJsonVerifier()
+
+    with _mock_get(html):
+        results = [
+            FilmarksMoviePage(url=MOVIE_URL, ld_json_verifier=verifier).parse()
+            for _ in range(verifier.verify_pages + 1)
+        ]
+
+    assert verifier.disabled
+    assert not verifier.trusted
+    assert all([result["directors"] == ("監督A",) for result in results])
+
+
+def test_movie_info_cache_hit_parses_only_review():
+    cache = FilmarksMovieInfoCache()
+
+    with _mock_get(_read_fixture("filmarks_movie.html")):
+        expected = FilmarksMoviePage(url=MOVIE_URL, cache=cache).parse()
+        cache.updated = False
+        page = FilmarksMoviePage(url=MOVIE_URL, cache=cache)
+
+    assert page.movie_info_cached
+    assert page.soup.find("div", class_="p-content-detail__body") is None
+    assert page.parse() == expected
+    assert not cache.updated
+
+
+def test_movie_info_cache_expired():
+    cache = FilmarksMovieInfoCache(ttl_weeks=1)
+    stale = {"title": "古いタイトル"}
+    cache.children["84000"] = (FilmarksMovieInfoCache.VERSION, datetime.now() - timedelta(weeks=2), stale)
+
+    with _mock_get(_read_fixture("filmarks_movie.html")):
+        result = FilmarksMoviePage(url=MOVIE_URL, cache=cache).parse()
+
+    assert result["title"] == "M&M 〜テスト映画〜"
+    assert cache.get("84000")["title"] == "M&M 〜テスト映画〜"
+
+
+def test_movie_info_cache_version_mismatch():
+    cache = FilmarksMovieInfoCache()
+    cache.children["84000"] = (datetime.now(), {"title": "古い形式"})
+    cache.children["85000"] = (FilmarksMovieInfoCache.VERSION - 1, datetime.now(), {"title": "古い抽出方法"})
+
+    assert cache.get("84000") is None
+    assert cache.get("85000") is None
+
+
+def test_movie_info_cache_refresh():
+    cache = FilmarksMovieInfoCache(refresh=True)
+    cache.children["84000"] = (FilmarksMovieInfoCache.VERSION, datetime.now(), {"title": "古いタイトル"})
+
+    with _mock_get(_read_fixture("filmarks_movie.html")):
+        page = FilmarksMoviePage(url=MOVIE_URL, cache=cache)
+        result = page.parse()
+
+    assert not page.movie_info_cached
+    assert result["title"] == "M&M 〜テスト映画〜"
+    assert cache.updated
+    assert cache.children["84000"][2]["title"] == "M&M 〜テスト映画〜"
+
+
+def test_ld_json_not_used_without_verifier():
+    pages = []
+    with _mock_get(_read_fixture("filmarks_movie.html")):
+        for _ in range(LdJsonVerifier.verify_pages + 1):
+            pages.append(FilmarksMoviePage(url=MOVIE_URL))
+            pages[-1].parse()
+
+    assert all([page.soup.find("div", class_="p-content-detail__body") is not None for page in pages])
+
+
+@pytest.mark.parametrize("content", [b"", b"\x80\x04\x95", b"not a pickle"])
+def test_movie_info_cache_load_broken_file(tmp_path, content):
+    path = tmp_path / "filmarks_movie_info.pkl"
+    path.write_bytes(content)
+    logger = mock.Mock()
+    cache = FilmarksMovieInfoCache()
+
+    with mock.patch.object(filmarks_obj, "SERIALIZED_MOVIE_INFO_PATH", path):
+        cache.load(logger)
+
+    assert cache.children == {}
+    logger.warning.assert_called_once()
+
+
+def test_movie_info_cache_serialize_and_load(tmp_path):
+    path = tmp_path / "filmarks_movie_info.pkl"
+    cache = FilmarksMovieInfoCache()
+    cache.set("84000", {"title": "タイトル"})
+
+    with mock.patch.object(filmarks_obj, "SERIALIZED_MOVIE_INFO_PATH", path):
+        cache.serialize()
+        loaded = FilmarksMovieInfoCache()
+        loaded.load()
+
+    assert loaded.get("84000") == {"title": "タイトル"}
+    assert list(tmp_path.iterdir()) == [path]
@@ -0,0 +1,217 @@
+import json
+from dataclasses import dataclass, field
+from datetime import date
+from typing import ClassVar
+from unittest import mock
+
+import pytest
+
+from notion_toys.notion import notion_obj
+from notion_toys.notion.notion_obj import (
+    NotionDB,
+    NotionMoviePage,
+    NotionRecordPage,
+    PropDate,
+    PropFiles,
+    PropRelation,
+    PropRichText,
+    PropTitle,
+    RecordSchema,
+    SchemaField,
+)
+
+
+def _movie_page(**kwargs) -> NotionMoviePage:
+    values = {
+        "title": "パラサイト 半地下の家族",
+        "score": 4.5,
+        "review": "1行目\n2行目",
+        "movie_url": "https://filmarks.com/movies/84000",
+        "img_url": "https://d2ueuvlup6lbue.cloudfront.net/parasite.jpg",
+        "watch_date": date(2022, 3, 4),
+        "release_year": 2019,
+        "countries": ("韓国",),
+        "genres": ("ドラマ", "サスペンス"),
+        "directors": ("ポン・ジュノ",),
+        "writers": (),
+        "casts": ("ソン・ガンホ", "イ・ソンギュン"),
+        "related_db_id": "0123456789abcdef0123456789abcdef",
+        "db_id": "fedcba9876543210fedcba9876543210",
+    }
+    return NotionMoviePage.init(**(values | kwargs))
+
+
+def _to_response(payload: dict) -> dict:
+    """リクエストのプロパティをNotionAPIのレスポンスの形にする"""
+    properties = {}
+    for name, value in payload["properties"].items():
+        (key, item), *_ = value.items()
+        if key in ("title", "rich_text"):
+            item = [{"type": "text", "plain_text": text["text"]["content"], **text} for text in item]
+        elif key == "files":
+            item = [{"type": "external", **file} for file in item]
+        elif key == "relation":
+            item = [{"id": f"{rel['id'][:8]}-{rel['id'][8:12]}-{rel['id'][12:]}"} for rel in item]
+        properties[name] = {"type": key, key: item}
+    return properties
+
+
+def test_movie_page_round_trip():
+    page = _movie_page()
+    payload = page._to_payload()
+
+    loaded = NotionMoviePage.from_payload(
+        id="abcdef01-2345-6789-abcd-ef0123456789",
+        db_id=payload["parent"]["database_id"],
+        prop=_to_response(payload),
+    )
+
+    assert loaded == page
+    assert loaded.id == "abcdef0123456789abcdef0123456789"
+    assert loaded.icon_url == page.icon_url
+    assert loaded._diff(page) == {}
+
+
+def test_movie_page_diff():
+    page = _movie_page()
+
+    assert page._diff(_movie_page(score=3.0)) == {
+        "properties": {"スコア": {"number": 3.0}},
+        "icon": {"external": {"url": "https://www.notion.so/icons/movie_yellow.svg"}},
+    }
+
+
+def test_prop_from_payload_empty_values():
+    assert PropTitle.from_payload("タイトル", {"title": []}) == PropTitle(name="タイトル", text="")
+    assert PropRichText.from_payload("感想", {"rich_text": []}) == PropRichText(name="感想", text="")
+    assert PropDate.from_payload("鑑賞日", {"date": None}) == PropDate(name="鑑賞日", date=None)
+    assert PropRelation.from_payload("集計", {"relation": []}) == PropRelation(name="集計", related_db_id="")
+
+
+def test_prop_from_payload_notion_values():
+    # 2000字を超える感想などは複数のテキストに分かれて返ってくる
+    value = {"rich_text": [{"plain_text": "前半"}, {"plain_text": "後半"}]}
+    assert PropRichText.from_payload("感想", value).text == "前半後半"
+
+    # Notionにアップロードされたポスター
+    value = {"files": [{"name": "poster.jpg", "type": "file", "file": {"url": "https://s3.example/poster.jpg"}}]}
+    assert PropFiles.from_payload("ポスター", value).file_urls == ("https://s3.example/poster.jpg",)
+
+
+def test_record_page_intermediate_class_without_schema():
+    class NotionDatedRecordPage(NotionRecordPage):
+        pass
+
+    @dataclass(frozen=True)
+    class NotionBookPage(NotionDatedRecordPage):
+        SCHEMA: ClassVar[RecordSchema] = RecordSchema(fields=(SchemaField("title", PropTitle, "書名"),))
+
+        title: PropTitle
+        db_id: str
+        id: str = field(hash=False, compare=False)
+
+    page = NotionBookPage.from_payload(id="id", db_id="db", prop={"書名": {"title": [{"plain_text": "本"}]}})
+
+    assert page == NotionBookPage(title=PropTitle(name="書名", text="本"), db_id="db", id="id")
+    assert page._to_payload() == {
+        "parent": {"database_id": "db"},
+        "properties": {"書名": {"title": [{"text": {"content": "本"}}]}},
+    }
+
+
+def _matches(filter: dict, day: date | None) -> bool:
+    """`_partition_filters`が作る鑑賞日のフィルターに`day`が当てはまるか"""
+    if "and" in filter:
+        return all([_matches(f, day) for f in filter["and"]])
+
+    (condition, value), *_ = filter["date"].items()
+    if condition == "is_empty":
+        return day is None
+    if condition == "is_not_empty":
+        return day is not None
+    if day is None:
+        return False
+    return {"before": day < date.fromisoformat(value), "on_or_after": day >= date.fromisoformat(value)}[condition]
+
+
+def _oldest(day: date):
+    return mock.patch.object(
+        NotionDB, "_query", return_value=iter([{"properties": {"鑑賞日": {"date": {"start": day.isoformat()}}}}])
+    )
+
+
+@pytest.mark.parametrize("first_year_offset", [-5, 0, 2])
+def test_partition_filters_cover_without_overlap(first_year_offset):
+    this_year = date.today().year
+    first_year = this_year + first_year_offset
+
+    with _oldest(date(first_year, 6, 1)):
+        filters = NotionDB(id="db")._partition_filters()
+
+    days = [None, date(first_year - 10, 1, 1), date(this_year + 5, 12, 31)]
+    for year in range(first_year - 1, this_year + 2):
+        days += [date(year, 1, 1), date(year, 12, 31)]
+    for day in days:
+        assert sum([_matches(f, day) for f in filters]) == 1, day
+
+    if first_year_offset >= 0:
+        # 1年分しかなければ日付の有無だけで分割する
+        assert len(filters) == 2
+
+
+def test_partition_filters_empty_db():
+    with mock.patch.object(NotionDB, "_query", return_value=iter([])):
+        filters = NotionDB(id="db")._partition_filters()
+
+    assert filters == [{"property": "鑑賞日", "date": {"is_empty": True}}]
+
+
+def _fake_query(partitions: list[list[dict]], edited: list[dict], serial: list[dict]):
+    def query(self, filter=None, sorts=None, page_size=10):
+        if filter is None:
+            return iter(serial)
+        if filter.get("timestamp") == "last_edited_time":
+            return iter(edited)
+        return iter(partitions[int(filter["property"])])
+
+    filters = [{"property": str(i)} for i in range(len(partitions))]
+    return (
+        mock.patch.object(NotionDB, "_query", query),
+        mock.patch.object(NotionDB, "_partition_filters", return_value=filters),
+    )
+
+
+def _query_partitioned(partitions, edited, serial) -> list[dict]:
+    query, partition_filters = _fake_query(partitions, edited, serial)
+    with query, partition_filters:
+        return sorted(NotionDB(id="db")._query_partitioned(), key=lambda obj: obj["id"])
+
+
+def test_query_partitioned_recovers_pages_edited_during_load():
+    a, b, c = {"id": "a"}, {"id": "b"}, {"id": "c"}
+    c_moved = {"id": "c", "moved": True}
+
+    # cの日付が読込済みの分割に変わって、どの分割にも返ってこなかった
+    assert _query_partitioned([[a], [b]], edited=[c_moved], serial=[]) == [a, b, c_moved]
+    # cが移動前と移動後の両方の分割から返ってきた
+    assert _query_partitioned([[a, c], [b, c_moved]], edited=[c_moved], serial=[]) == [a, b, c_moved]
+
+
+def test_query_partitioned_falls_back_to_serial_on_overlap():
+    a, b = {"id": "a"}, {"id": "b"}
+
+    assert _query_partitioned([[a], [b]], edited=[], serial=[{"id": "serial"}]) == [a, b]
+    assert _query_partitioned([[a, b], [b]], edited=[], serial=[a, b, {"id": "c"}]) == [a, b, {"id": "c"}]
+
+
+def test_query_follows_cursor():
+    responses = [
+        {"results": [{"id": "a"}], "has_more": True, "next_cursor": "cursor"},
+        {"results": [{"id": "b"}], "has_more": False, "next_cursor": None},
+    ]
+    with mock.patch.object(notion_obj.requests, "post") as post:
+        post.return_value.json.side_effect = responses
+        results = list(NotionDB(id="db")._query(filter={"property": "鑑賞日", "date": {"is_empty": True}}))
+
+    assert results == [{"id": "a"}, {"id": "b"}]
+    assert [json.loads(call.kwargs["data"]).get("start_cursor") for call in post.call_args_list] == [None, "cursor"]
@@ -0,0 +1,30 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from notion_toys.notion.notion_obj import PropUrl
+from notion_toys.notion.utils import RateLimiter, filmarks_id_of
+
+
+def test_rate_limiter_shared_between_threads():
+    requests_per_second = 50
+    limiter = RateLimiter(requests_per_second)
+
+    def wait() -> float:
+        limiter.wait()
+        return time.monotonic()
+
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        finished = sorted(executor.map(lambda _: wait(), range(12)))
+
+    interval = 1 / requests_per_second
+    for i, finished_at in enumerate(finished):
+        # i番目のリクエストは最初から i * interval 秒以上空けて通る
+        assert finished_at - started_at >= i * interval - 1e-3
+
+
+def test_filmarks_id_of():
+    url = "https://filmarks.com/movies/84000"
+
+    assert filmarks_id_of(url) == "84000"
+    assert PropUrl(name="filmarks", url=url).to_filmarks_id() == filmarks_id_of(url)